@@ -5,7 +5,15 @@
 Corrected arc geometry calculations
 """
 
-import math
+import argparse
+import functools
+import gzip
+import io
+import sys
+from math import sqrt
+from typing import BinaryIO, Callable, Optional, Tuple, Union
+
+import numpy as np
 
 # ========== ADJUSTABLE PARAMETERS ==========
 XC = 0.0            # Arc apex X coordinate
@@ -28,24 +36,27 @@ SAFE_Z = 0.0            # Safe retract height
 
 # ========== HELPER FUNCTIONS ==========
 
-def calc_arc_z(x, r, z_layer, xc=XC, zc=ZC):
+def calc_arc_z(x: float, r_squared: float, z_floor: float, xc: float = XC, zc: float = ZC) -> float:
     """
     Calculate Z value on arc surface at position X
     Arc equation (INVERTED 180°): Z = Zc + sqrt(R^2 - (X-Xc)^2) - R0
     Returns: max(Z_arc, Z_layer) to not cut deeper than current layer
     All Z values are offset by -R0 to lower the entire toolpath
+    r_squared (= R^2) and z_floor (= Z_layer - R0) are precomputed per layer
+    Arc paths use the vectorized copy of this formula in _arc_sample;
+    any change here must be made there too
     """
     dx = x - xc
-    discriminant = r * r - dx * dx
+    discriminant = r_squared - dx * dx
 
     if discriminant < 0:
         # Point outside arc boundary, use layer depth
-        return z_layer - R0
+        return z_floor
 
-    z_arc = zc + math.sqrt(discriminant) - R0  # Subtract R0 to lower the path
-    return max(z_arc, z_layer - R0)  # Changed from min to max, with R0 offset
+    z_arc = zc + sqrt(discriminant) - R0  # Subtract R0 to lower the path
+    return max(z_arc, z_floor)  # Changed from min to max, with R0 offset
 
-def calc_x_range(r, z_layer, xc=XC, zc=ZC):
+def calc_x_range(r: float, z_layer: float, xc: float = XC, zc: float = ZC) -> Tuple[float, float]:
     """
     Calculate valid X range for current layer (INVERTED 180°)
     Limited to ±X_RANGE from apex center
@@ -58,37 +69,104 @@ def calc_x_range(r, z_layer, xc=XC, zc=ZC):
         return xc, xc
 
     # Calculate maximum possible range based on arc geometry
-    max_x_range = math.sqrt(discriminant)
+    max_x_range = sqrt(discriminant)
 
     # Limit to user-specified X_RANGE
     actual_x_range = min(max_x_range, X_RANGE)
 
     return xc - actual_x_range, xc + actual_x_range
 
-def generate_arc_path(x_start, x_end, y, z_layer, r):
+def _layer_x_half_range(layer_num: int) -> float:
     """
-    Generate arc path from x_start to x_end at constant Y
+    Closed form of calc_x_range for layer k (no branch, one sqrt)
+    With r = R0 - k*d and dz = -k*d - ZC:
+    r^2 - dz^2 = (r + dz) * (r - dz) = (R0 - ZC - 2*k*d) * (R0 + ZC)
+    Layers not clamped to X_RANGE may differ from calc_x_range by rounding
+    """
+    discriminant = (R0 - ZC - 2 * DEPTH_PER_LAYER * layer_num) * (R0 + ZC)
+    return min(sqrt(max(discriminant, 0.0)), X_RANGE)
+
+@functools.lru_cache(maxsize=None)
+def _step_index(num_steps: int) -> np.ndarray:
+    """
+    Read-only 0..num_steps float array, shared by paths with equal step count
+    Most layers are clamped to X_RANGE and reuse the same array
     """
-    lines = []
+    steps = np.arange(num_steps + 1, dtype=np.float64)
+    steps.flags.writeable = False
+    return steps
 
+def _arc_sample(x_start: float, x_end: float,
+                r_squared: float, z_floor: float) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Sample arc points from x_start to x_end
+    r_squared and z_floor (= z_layer - R0) are precomputed per layer
+    Returns: (xs, zs) float64 arrays, num_steps + 1 points each
+    """
     # Calculate number of X steps
     x_distance = abs(x_end - x_start)
     num_steps = max(1, int(x_distance / DX))
 
-    if num_steps == 0:
-        return lines
-
     x_step = (x_end - x_start) / num_steps
 
-    for i in range(num_steps + 1):
-        x_current = x_start + i * x_step
-        z = calc_arc_z(x_current, r, z_layer)
-        lines.append(f"G1 X{x_current:.3f} Y{y:.3f} Z{z:.3f}")
+    # Same sampling as x_start + i * x_step, including the end point
+    xs = _step_index(num_steps) * x_step + x_start
+
+    # Vectorized calc_arc_z, branchless and in place in one buffer:
+    # Z = max(ZC + sqrt(max(r^2 - (X-XC)^2, 0)) - R0, z_floor)
+    # Points outside the arc (r^2 - (X-XC)^2 < 0) use layer depth, as in calc_arc_z
+    # Must stay in sync with calc_arc_z, which gives the cut-down Z moves
+    zs = xs - XC
+    np.multiply(zs, zs, out=zs)
+    np.subtract(r_squared, zs, out=zs)
+    outside = zs < 0
+    np.maximum(zs, 0.0, out=zs)
+    np.sqrt(zs, out=zs)
+    np.add(zs, ZC, out=zs)
+    np.subtract(zs, R0, out=zs)
+    np.maximum(zs, z_floor, out=zs)
+    np.copyto(zs, z_floor, where=outside)
+
+    return xs, zs
+
+def generate_arc_path(w: Callable[[bytes], object], x_start: float, x_end: float,
+                      y: float, r_squared: float, z_floor: float) -> None:
+    """
+    Generate arc path from x_start to x_end at constant Y
+    Lines are emitted as bytes through the writer w (e.g. bytearray.extend)
+    """
+    xs, zs = _arc_sample(x_start, x_end, r_squared, z_floor)
+
+    # Y is constant along the path: bake it into the template once
+    g1 = b"G1 X%%.3f Y%.3f Z%%.3f\n" % y
+
+    # Format the whole path in one % call over interleaved X/Z values
+    xz = np.column_stack((xs, zs)).ravel().tolist()
+    w((g1 * len(xs)) % tuple(xz))
 
-    return lines
+def _layer_params() -> Tuple[float, float, float, float, float, float]:
+    """Current module parameters that a layer's G-code depends on"""
+    return (R0, DEPTH_PER_LAYER, DX, X_RANGE, XC, ZC)
 
-def generate_layer(layer_num, y_position=Y0):
+def generate_layer(layer_num: int, y_position: float = Y0) -> Tuple[bytes, Optional[float]]:
     """Generate single layer scanning path with zigzag pattern
+    Returns: (layer G-code bytes, X end position)
+    Results are memoized per (layer_num, y_position) and the current
+    geometry parameters, so changing R0, DX, ... at runtime is safe
+    """
+    return _cached_layer(layer_num, y_position, _layer_params())
+
+@functools.lru_cache(maxsize=None)
+def _cached_layer(layer_num: int, y_position: float,
+                  params: Tuple[float, float, float, float, float, float]) -> Tuple[bytes, Optional[float]]:
+    """
+    Memoized _build_layer; params (from _layer_params) is only part of the key,
+    _build_layer reads the same module parameters
+    """
+    return _build_layer(layer_num, y_position)
+
+def _build_layer(layer_num: int, y_position: float) -> Tuple[bytes, Optional[float]]:
+    """Build single layer scanning path with zigzag pattern (uncached)
     Layer 1: Move to right along surface, cut down, then cut left (ends at left)
     Layer 2: Cut down at left, then cut right (ends at right)
     Layer 3: Cut down at right, then cut left (ends at left)
@@ -98,114 +176,125 @@ def generate_layer(layer_num, y_position=Y0):
     r_layer = R0 - DEPTH_PER_LAYER * layer_num
 
     if r_layer <= 0:
-        return f"; Layer {layer_num}: SKIPPED (R={r_layer:.2f} <= 0)", None
+        return b"; Layer %d: SKIPPED (R=%.2f <= 0)\n" % (layer_num, r_layer), None
 
     # Calculate X range
-    x_start, x_end = calc_x_range(r_layer, z_layer)
-
-    lines = []
-    lines.append(f"; ====== Layer {layer_num}: Z = {z_layer:.1f} ======")
-    lines.append(f"; R = {r_layer:.1f}, X = [{x_start:.2f}, {x_end:.2f}]")
-
-    # Determine direction based on layer number
-    if layer_num % 2 == 1:  # Odd layers: Right to Left
-        lines.append(f"; Path: Right -> Left (zigzag)")
-        lines.append("")
-
-        if layer_num == 1:
-            # First layer: start from center, move to right edge along surface
-            lines.append("; Move from center to right edge along arc surface (no cutting)")
-            lines.extend(generate_arc_path(XC, x_end, y_position, z_layer, R0))
-            lines.append("")
+    x_half_range = _layer_x_half_range(layer_num)
+    x_start, x_end = XC - x_half_range, XC + x_half_range
 
-        # Cut down at right edge
-        lines.append(f"; Cut down to layer depth at right edge")
-        z_right = calc_arc_z(x_end, r_layer, z_layer)
-        lines.append(f"G1 Z{z_right:.3f}")
-        lines.append("")
+    # Layer invariants, computed once instead of per point
+    r_squared = r_layer * r_layer
+    z_floor = z_layer - R0
 
-        # Cut from right to left along arc
-        lines.append("; Cut along arc from right to left")
-        lines.extend(generate_arc_path(x_end, x_start, y_position, z_layer, r_layer))
-        lines.append("")
+    buf = bytearray()
+    w = buf.extend
 
-        end_position = x_start  # End at left
+    w(b"; ====== Layer %d: Z = %.1f ======\n" % (layer_num, z_layer))
+    w(b"; R = %.1f, X = [%.2f, %.2f]\n" % (r_layer, x_start, x_end))
 
+    # Determine direction based on layer number
+    if layer_num % 2 == 1:  # Odd layers: Right to Left
+        x_from, x_to = x_end, x_start
+        side_from, side_to = b"right", b"left"
     else:  # Even layers: Left to Right
-        lines.append(f"; Path: Left -> Right (zigzag)")
-        lines.append("")
-
-        # Cut down at left edge
-        lines.append(f"; Cut down to layer depth at left edge")
-        z_left = calc_arc_z(x_start, r_layer, z_layer)
-        lines.append(f"G1 Z{z_left:.3f}")
-        lines.append("")
-
-        # Cut from left to right along arc
-        lines.append("; Cut along arc from left to right")
-        lines.extend(generate_arc_path(x_start, x_end, y_position, z_layer, r_layer))
-        lines.append("")
-
-        end_position = x_end  # End at right
-
-    return "\n".join(lines), end_position
-
-def generate_gcode():
-    """Generate complete G-code program"""
-
-    output = []
+        x_from, x_to = x_start, x_end
+        side_from, side_to = b"left", b"right"
+
+    w(b"; Path: %s -> %s (zigzag)\n" % (side_from.capitalize(), side_to.capitalize()))
+    w(b"\n")
+
+    if layer_num == 1:
+        # First layer: start from center, move to right edge along surface
+        w(b"; Move from center to right edge along arc surface (no cutting)\n")
+        generate_arc_path(w, XC, x_end, y_position, R0 * R0, z_floor)
+        w(b"\n")
+
+    # Cut down at the starting edge
+    w(b"; Cut down to layer depth at %s edge\n" % side_from)
+    z_edge = calc_arc_z(x_from, r_squared, z_floor, XC, ZC)
+    w(b"G1 Z%.3f\n" % z_edge)
+    w(b"\n")
+
+    # Cut along arc to the opposite edge
+    w(b"; Cut along arc from %s to %s\n" % (side_from, side_to))
+    generate_arc_path(w, x_from, x_to, y_position, r_squared, z_floor)
+    w(b"\n")
+
+    return bytes(buf), x_to  # End at the opposite edge
+
+def generate_gcode(out: Optional[Union[BinaryIO, io.BufferedIOBase]] = None,
+                   cache_layers: bool = False) -> None:
+    """Generate complete G-code program, streamed as UTF-8 bytes
+    out: binary file object to write to (default: sys.stdout.buffer)
+    cache_layers: reuse memoized layer blocks (generate_layer) across calls,
+    e.g. for repeated previews; keeps every layer in memory. By default each
+    layer is built, written and released, so only one layer is held at a time
+    """
+    if out is None:
+        out = sys.stdout.buffer
+    w = out.write
+    build_layer = generate_layer if cache_layers else _build_layer
 
     # Header
-    output.append("%")
-    output.append("; " + "=" * 60)
-    output.append("; 2.5D Arc Surface Constant-Thickness Scanning (INVERTED 180°)")
-    output.append("; ")
-    output.append(f"; Auto-generated by Python Generator v2")
-    output.append(f"; Parameters: R0={R0}mm, Layers={TOTAL_LAYERS}, DX={DX}mm")
-    output.append(f"; Arc center: (X={XC}, Z={ZC})")
-    output.append(f"; Machining range: X = {XC - X_RANGE:.2f} to {XC + X_RANGE:.2f} (±{X_RANGE}mm from apex)")
-    output.append("; Arc orientation: Convex upward (180° inverted)")
-    output.append("; " + "=" * 60)
-    output.append("")
+    w(b"%\n")
+    w(b"; " + b"=" * 60 + b"\n")
+    w("; 2.5D Arc Surface Constant-Thickness Scanning (INVERTED 180°)\n".encode())
+    w(b"; \n")
+    w(b"; Auto-generated by Python Generator v2\n")
+    w(b"; Parameters: R0=%amm, Layers=%a, DX=%amm\n" % (R0, TOTAL_LAYERS, DX))
+    w(b"; Arc center: (X=%a, Z=%a)\n" % (XC, ZC))
+    w(f"; Machining range: X = {XC - X_RANGE:.2f} to {XC + X_RANGE:.2f} (±{X_RANGE}mm from apex)\n".encode())
+    w("; Arc orientation: Convex upward (180° inverted)\n".encode())
+    w(b"; " + b"=" * 60 + b"\n")
+    w(b"\n")
 
     # Initialization
-    output.append("; ========== INITIALIZATION ==========")
-    output.append("G90                 ; Absolute coordinates")
-    output.append("G21                 ; Metric units")
-    output.append("G40 G49 G80         ; Cancel offsets and cycles")
-    output.append("")
-    output.append(f"F{FEED_RATE}            ; Set feed rate")
-    output.append("")
+    w(b"; ========== INITIALIZATION ==========\n")
+    w(b"G90                 ; Absolute coordinates\n")
+    w(b"G21                 ; Metric units\n")
+    w(b"G40 G49 G80         ; Cancel offsets and cycles\n")
+    w(b"\n")
+    w(b"F%a            ; Set feed rate\n" % FEED_RATE)
+    w(b"\n")
 
     # Calculate arc apex (highest point on inverted arc)
     # Origin stays at Z = ZC
     z_apex_origin = ZC
 
-    output.append(f"G0 Z{SAFE_Z:.1f}         ; Retract to safe height")
-    output.append(f"G0 X{XC:.1f} Y{Y0:.1f}    ; Move to apex X,Y position")
-    output.append(f"G0 Z{z_apex_origin:.3f}        ; Lower to origin (Z = ZC + R0)")
-    output.append("")
-    output.append("; NOTE: All subsequent machining paths have Z offset by -R0")
-    output.append("")
+    w(b"G0 Z%.1f         ; Retract to safe height\n" % SAFE_Z)
+    w(b"G0 X%.1f Y%.1f    ; Move to apex X,Y position\n" % (XC, Y0))
+    w(b"G0 Z%.3f        ; Lower to origin (Z = ZC + R0)\n" % z_apex_origin)
+    w(b"\n")
+    w(b"; NOTE: All subsequent machining paths have Z offset by -R0\n")
+    w(b"\n")
 
     # Layer scanning
-    output.append("; ========== MAIN MACHINING LOOP ==========")
-    output.append("")
+    w(b"; ========== MAIN MACHINING LOOP ==========\n")
+    w(b"\n")
 
     for k in range(1, TOTAL_LAYERS + 1):
-        layer_gcode, _ = generate_layer(k)
-        output.append(layer_gcode)
-        output.append("")
+        layer_gcode, _ = build_layer(k, Y0)
+        w(layer_gcode)
+        w(b"\n")
 
     # Finish
-    output.append("; ========== MACHINING COMPLETE ==========")
-    output.append(f"G0 Z{SAFE_Z:.1f}         ; Retract tool")
-    output.append(f"G0 X0.0 Y0.0        ; Return to origin")
-    output.append("M30                 ; Program end")
-    output.append("%")
-
-    return "\n".join(output)
+    w(b"; ========== MACHINING COMPLETE ==========\n")
+    w(b"G0 Z%.1f         ; Retract tool\n" % SAFE_Z)
+    w(b"G0 X0.0 Y0.0        ; Return to origin\n")
+    w(b"M30                 ; Program end\n")
+    w(b"%\n")
 
 # ========== MAIN ==========
 if __name__ == "__main__":
-    print(generate_gcode())
+    parser = argparse.ArgumentParser(description="2.5D arc surface scanning G-code generator v2")
+    parser.add_argument("--gzip", action="store_true",
+                        help="gzip-compress the G-code written to stdout (e.g. > output.nc.gz)")
+    args = parser.parse_args()
+
+    if args.gzip:
+        # Fixed name/mtime keep the compressed output reproducible
+        with gzip.GzipFile(filename="", mode="wb", compresslevel=6,
+                           fileobj=sys.stdout.buffer, mtime=0) as out:
+            generate_gcode(out=out)
+    else:
+        generate_gcode(out=sys.stdout.buffer)